@@ -68,7 +68,7 @@ def create_dataset(dataset_opt, return_collate=False):
         default_params.update(dataset_opt)
         dataset_opt = munchify(default_params)
         if opt_get(dataset_opt, ['needs_collate'], True):
-            collate = C()
+            collate = C(pin_memory=opt_get(dataset_opt, ['pin_memory'], True))
     elif mode == 'paired_voice_audio':
         from data.audio.paired_voice_audio_dataset import TextWavLoader as D
         from models.audio.tts.tacotron2 import create_hparams
@@ -1,10 +1,15 @@
+import concurrent.futures
+import hashlib
 import os
 import random
 
+import numpy as np
+import soundfile
 import torch
 import torch.nn.functional as F
 import torch.utils.data
 import torchaudio
+from torch.nn.utils.rnn import pad_sequence
 from tqdm import tqdm
 
 from data.audio.unsupervised_audio_dataset import load_audio
@@ -44,6 +49,77 @@ def load_voxpopuli(filename):
     return filepaths_and_text
 
 
+class PackedSequences:
+    """
+    A list of 1D numpy arrays stored as one flat buffer plus offsets. Forked dataloader workers end up copying any
+    Python object whose refcount they touch, so large lists of small objects get duplicated in every worker.
+    """
+    def __init__(self, sequences, dtype):
+        self.offsets = np.zeros(len(sequences)+1, dtype=np.int64)
+        np.cumsum([len(s) for s in sequences], out=self.offsets[1:])
+        self.buffer = np.concatenate([np.asarray(s, dtype=dtype) for s in sequences]) if len(sequences) > 0 else np.zeros(0, dtype=dtype)
+
+    @classmethod
+    def from_buffer(cls, buffer, offsets):
+        packed = cls.__new__(cls)
+        packed.buffer, packed.offsets = buffer, offsets
+        return packed
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i+1]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class PackedStrings(PackedSequences):
+    def __init__(self, strings):
+        super().__init__([np.frombuffer(s.encode('utf-8'), dtype=np.uint8) for s in strings], np.uint8)
+
+    def __getitem__(self, i):
+        return super().__getitem__(i).tobytes().decode('utf-8')
+
+
+def save_mel_buffer_to_file(mel, path, dtype='float32'):
+    """
+    Saves a MEL to disk. dtype='float16' halves the file size. dtype='uint8' quarters it by quantizing each mel channel
+    against its own min/max, so quiet high-frequency bands keep their resolution. uint8 buffers are stored in npz
+    format at exactly the given path.
+    """
+    if dtype not in ['float32', 'float16', 'uint8']:
+        raise NotImplementedError(f"Unsupported mel buffer dtype: {dtype}")
+    mel = mel.detach().cpu().float()
+    # Always written through a file handle: np.save/np.savez would otherwise append '.npy'/'.npz' to paths lacking them,
+    # and load_mel_buffer_from_file would no longer find the file at the given path.
+    with open(path, 'wb') as f:
+        if dtype == 'float32':
+            np.save(f, mel.numpy())
+        elif dtype == 'float16':
+            np.save(f, mel.half().numpy())
+        else:
+            lo = mel.amin(dim=-1, keepdim=True)
+            scale = (mel.amax(dim=-1, keepdim=True) - lo).clamp_min(1e-8) / 255
+            q = ((mel - lo) / scale).round().to(torch.uint8)
+            np.savez(f, q=q.numpy(), lo=lo.numpy(), scale=scale.numpy())
+
+
+def load_mel_buffer_from_file(path):
+    # Memory-mapped copy-on-write, so float32 buffers are shared with torch rather than copied; pages are only
+    # duplicated if the caller writes to them.
+    data = np.load(path, mmap_mode='c')
+    if isinstance(data, np.lib.npyio.NpzFile):
+        with data:
+            return torch.from_numpy(data['q']).float().mul_(torch.from_numpy(data['scale'])).add_(torch.from_numpy(data['lo']))
+    mel = torch.from_numpy(data)
+    if mel.dtype != torch.float32:
+        mel = mel.float()
+    return mel
+
+
+def audio_cache_key(audiopath, sample_rate):
+    return hashlib.md5(f'{audiopath}{sample_rate}'.encode()).hexdigest()
+
+
 class TextWavLoader(torch.utils.data.Dataset):
     def __init__(self, hparams):
         self.path = hparams['path']
@@ -58,7 +134,7 @@ class TextWavLoader(torch.utils.data.Dataset):
         self.load_conditioning = opt_get(hparams, ['load_conditioning'], False)
         self.conditioning_candidates = opt_get(hparams, ['num_conditioning_candidates'], 3)
         self.conditioning_length = opt_get(hparams, ['conditioning_length'], 44100)
-        self.audiopaths_and_text = []
+        audiopaths_and_text = []
         for p, fm in zip(self.path, fetcher_mode):
             if fm == 'lj' or fm == 'libritts':
                 fetcher_fn = load_filepaths_and_text
@@ -72,24 +148,197 @@ class TextWavLoader(torch.utils.data.Dataset):
                 fetcher_fn = load_voxpopuli
             else:
                 raise NotImplementedError()
-            self.audiopaths_and_text.extend(fetcher_fn(p))
+            audiopaths_and_text.extend(fetcher_fn(p))
+        # Paths and transcripts are packed into flat buffers rather than kept as a list of Python lists, which every
+        # dataloader worker would otherwise end up copying. The dataset order is a seeded permutation over them.
+        self.paths = PackedStrings([at[0] for at in audiopaths_and_text])
+        self.texts = PackedStrings([at[1] for at in audiopaths_and_text])
+        del audiopaths_and_text
+        self.perm = np.random.default_rng(hparams.seed).permutation(len(self.paths))
         self.text_cleaners = hparams.text_cleaners
         self.sample_rate = hparams.sample_rate
-        random.seed(hparams.seed)
-        random.shuffle(self.audiopaths_and_text)
         self.max_wav_len = opt_get(hparams, ['max_wav_length'], None)
         self.max_text_len = opt_get(hparams, ['max_text_length'], None)
         # If needs_collate=False, all outputs will be aligned and padded at maximum length.
         self.needs_collate = opt_get(hparams, ['needs_collate'], True)
         if not self.needs_collate:
             assert self.max_wav_len is not None and self.max_text_len is not None
+        # When set, decoded & resampled audio is saved to this directory as .npy files and memory-mapped on later reads,
+        # so each clip only gets decoded once rather than once per epoch.
+        self.audio_cache_dir = opt_get(hparams, ['audio_cache_dir'], None)
+        if self.audio_cache_dir is not None:
+            os.makedirs(self.audio_cache_dir, exist_ok=True)
+        # 'float16' or 'int16' halve the size of the audio cache (and the bandwidth needed to read it back).
+        self.audio_cache_dtype = opt_get(hparams, ['audio_cache_dtype'], 'float32')
+        assert self.audio_cache_dtype in ['float32', 'float16', 'int16']
+        # Clips packed by pack_audio_to_disk() are read as slices of a few large memory-mapped shards rather than each
+        # being opened and decoded from its own file.
+        self.packed_audio_dir = opt_get(hparams, ['packed_audio_dir'], None)
+        if self.packed_audio_dir is not None:
+            index = torch.load(os.path.join(self.packed_audio_dir, 'index.pth'))
+            assert index['sample_rate'] == self.sample_rate
+            # The packed row of each clip, aligned with self.paths (-1 for clips that weren't packed). Kept as a flat array
+            # so that workers don't each end up with their own copy of a path->row dict.
+            rows = {p: i for i, p in enumerate(index['paths'])}
+            self.packed_rows = np.array([rows.get(self.paths[i], -1) for i in range(len(self.paths))], dtype=np.int64)
+            del rows
+            self.packed_shards, self.packed_offsets, self.packed_lengths = index['shards'].numpy(), index['offsets'].numpy(), index['lengths'].numpy()
+            self.shard_maps = {}  # Opened lazily, so each dataloader worker maps the shards itself.
+            # Alternatively, load every shard into shared memory up front. Forked dataloader workers then all slice the
+            # same tensors and no per-clip filesystem access happens at all, which matters on network filesystems.
+            self.packed_shard_tensors = None
+            if opt_get(hparams, ['packed_audio_in_memory'], False):
+                self.packed_shard_tensors = {}
+                for shard in tqdm(np.unique(self.packed_shards)):
+                    data = np.fromfile(os.path.join(self.packed_audio_dir, f'audio_{shard}.f32'), dtype=np.float32)
+                    self.packed_shard_tensors[int(shard)] = torch.from_numpy(data).share_memory_()
+        # Transcripts are fixed for the lifetime of the dataset, so the text cleaners can optionally be run once up front
+        # instead of on every __getitem__. Symbol IDs fit comfortably in an int16.
+        self.text_sequences = None
+        if opt_get(hparams, ['precompute_text'], False):
+            self.text_sequences = self.precompute_text_sequences(opt_get(hparams, ['text_sequence_cache'], None))
+        # Over-long clips are normally only discovered in __getitem__, after they have been decoded. With prefilter_lengths
+        # set, they are instead dropped up front using the (cheap) lengths exceeds_max_wav_len() reads from headers.
+        self.prefiltered = opt_get(hparams, ['prefilter_lengths'], False)
+        if self.prefiltered and (self.max_wav_len is not None or self.max_text_len is not None):
+            valid = self.compute_valid_mask(opt_get(hparams, ['valid_indices_cache'], None))
+            self.perm = self.perm[valid[self.perm]]
+            print(f"Filtered dataset down to {len(self.perm)} of {len(self.paths)} clips.")
+        # With overlap_audio_decode set, audio is decoded on a helper thread while the text cleaners run. Decoding spends
+        # most of its time outside the GIL, so this helps when there are no spare cores for additional workers.
+        self.overlap_audio_decode = opt_get(hparams, ['overlap_audio_decode'], False)
+        self.decode_pool = None
+        self.decode_pool_pid = None
 
-    def get_wav_text_pair(self, audiopath_and_text):
-        # separate filename and text
-        audiopath, text = audiopath_and_text[0], audiopath_and_text[1]
-        text_seq = self.get_text(text)
+    def __getstate__(self):
+        # Thread pools can't be pickled (e.g. when workers are spawned rather than forked); each process makes its own.
+        state = self.__dict__.copy()
+        state['decode_pool'] = None
+        state['decode_pool_pid'] = None
+        return state
+
+    def get_decode_pool(self):
+        # Created lazily and per-process, since threads do not survive the fork into dataloader workers.
+        if self.decode_pool is None or self.decode_pool_pid != os.getpid():
+            self.decode_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self.decode_pool_pid = os.getpid()
+        return self.decode_pool
+
+    def precompute_text_sequences(self, cache_path):
+        texts_key = hashlib.md5(''.join([str(self.text_cleaners)] + [self.texts[i] for i in range(len(self.texts))]).encode()).hexdigest()
+        if cache_path is not None and os.path.exists(cache_path):
+            cache = torch.load(cache_path)
+            if cache['key'] == texts_key and 'buffer' in cache.keys():
+                return PackedSequences.from_buffer(cache['buffer'].numpy(), cache['offsets'].numpy())
+            print(f"Text sequence cache at {cache_path} is stale, rebuilding..")
+        sequences = PackedSequences([text_to_sequence(self.texts[i], self.text_cleaners) for i in tqdm(range(len(self.texts)))], np.int16)
+        if cache_path is not None:
+            torch.save({'key': texts_key, 'buffer': torch.from_numpy(sequences.buffer), 'offsets': torch.from_numpy(sequences.offsets)}, cache_path)
+        return sequences
+
+    def compute_valid_mask(self, cache_path):
+        key = hashlib.md5(''.join([f'{self.max_wav_len}{self.max_text_len}{self.sample_rate}{self.text_cleaners}'] +
+                                  [self.paths[i] + self.texts[i] for i in range(len(self.paths))]).encode()).hexdigest()
+        if cache_path is not None and os.path.exists(cache_path):
+            cache = torch.load(cache_path)
+            if cache['key'] == key and 'valid_mask' in cache.keys():
+                return cache['valid_mask'].numpy()
+            print(f"Valid indices cache at {cache_path} is stale, rebuilding..")
+        valid = np.ones(len(self.paths), dtype=bool)
+        for i in tqdm(range(len(self.paths))):
+            if self.max_text_len is not None:
+                if self.text_sequences is not None:
+                    text_len = len(self.text_sequences[i])
+                else:
+                    text_len = len(text_to_sequence(self.texts[i], self.text_cleaners))
+                if text_len > self.max_text_len:
+                    valid[i] = False
+                    continue
+            if self.max_wav_len is not None and self.exceeds_max_wav_len(self.paths[i], i):
+                valid[i] = False
+        if cache_path is not None:
+            torch.save({'key': key, 'valid_mask': torch.from_numpy(valid)}, cache_path)
+        return valid
+
+    def load_packed_wav(self, row):
+        shard = int(self.packed_shards[row])
+        start = self.packed_offsets[row]
+        if self.packed_shard_tensors is not None:
+            # Cloned so that nothing downstream can modify the shared buffer in-place.
+            return self.packed_shard_tensors[shard][start:start+self.packed_lengths[row]].clone().unsqueeze(0)
+        if shard not in self.shard_maps:
+            self.shard_maps[shard] = np.memmap(os.path.join(self.packed_audio_dir, f'audio_{shard}.f32'), dtype=np.float32, mode='c')
+        return torch.from_numpy(np.asarray(self.shard_maps[shard][start:start+self.packed_lengths[row]])).unsqueeze(0)
+
+    def load_wav(self, audiopath, item=None):
+        # Only clips from the dataset itself (identified by item) can be packed; conditioning clips are looked up by path.
+        if self.packed_audio_dir is not None and item is not None and self.packed_rows[item] >= 0:
+            return self.load_packed_wav(self.packed_rows[item])
+        if self.audio_cache_dir is None:
+            return load_audio(audiopath, self.sample_rate)
+        cache_file = os.path.join(self.audio_cache_dir, f'{audio_cache_key(audiopath, self.sample_rate)}.npy')
+        if os.path.exists(cache_file):
+            # Copy-on-write mapping: no copy is made unless something downstream modifies the clip in-place.
+            wav = torch.from_numpy(np.load(cache_file, mmap_mode='c'))
+            if wav.dtype == torch.int16:
+                return wav.float().div_(32767)
+            elif wav.dtype == torch.float16:
+                return wav.float()
+            return wav
         wav = load_audio(audiopath, self.sample_rate)
-        return (text_seq, wav, text, audiopath_and_text[0])
+        if self.audio_cache_dtype == 'int16':
+            cached = (wav * 32767).round().short()
+        elif self.audio_cache_dtype == 'float16':
+            cached = wav.half()
+        else:
+            cached = wav
+        # Write to a temporary file first so that concurrent workers never observe a partially written cache entry.
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.save(f, cached.numpy())
+        os.replace(tmp_file, cache_file)
+        return wav
+
+    def get_wav_text_pair(self, index):
+        # separate filename and text
+        audiopath, text = self.paths[index], self.texts[index]
+        wav_future = None
+        if self.overlap_audio_decode and self.text_sequences is None:
+            wav_future = self.get_decode_pool().submit(self.load_wav_within_limits, audiopath, index)
+        if self.text_sequences is not None:
+            text_seq = torch.from_numpy(self.text_sequences[index]).int()
+        else:
+            text_seq = self.get_text(text)
+        if self.max_text_len is not None and text_seq.shape[0] > self.max_text_len:
+            wav = None  # This item will be rejected by __getitem__ anyway, so don't bother decoding it.
+            if wav_future is not None:
+                wav_future.cancel()
+        elif wav_future is not None:
+            wav = wav_future.result()
+        else:
+            wav = self.load_wav_within_limits(audiopath, index)
+        return (text_seq, wav, text, audiopath)
+
+    def load_wav_within_limits(self, audiopath, item):
+        if self.max_wav_len is not None and not self.prefiltered and self.exceeds_max_wav_len(audiopath, item):
+            return None
+        return self.load_wav(audiopath, item)
+
+    def exceeds_max_wav_len(self, audiopath, item):
+        # Reading the length from a header is far cheaper than decoding and resampling a clip that will be thrown away.
+        # The original file is only consulted for clips that have neither been packed nor cached.
+        if self.packed_audio_dir is not None and self.packed_rows[item] >= 0:
+            return self.packed_lengths[self.packed_rows[item]] > self.max_wav_len
+        if self.audio_cache_dir is not None:
+            # Cached clips are already at the target sample rate and their length is in the .npy header.
+            cache_file = os.path.join(self.audio_cache_dir, f'{audio_cache_key(audiopath, self.sample_rate)}.npy')
+            if os.path.exists(cache_file):
+                return np.load(cache_file, mmap_mode='r').shape[-1] > self.max_wav_len
+        try:
+            info = soundfile.info(audiopath)
+        except:
+            return False  # Leave files soundfile can't parse to the regular load path.
+        return info.frames * self.sample_rate / info.samplerate > self.max_wav_len
 
     def get_text(self, text):
         text_norm = torch.IntTensor(text_to_sequence(text, self.text_cleaners))
@@ -104,7 +353,7 @@ class TextWavLoader(torch.utils.data.Dataset):
         # Sample with replacement. This can get repeats, but more conveniently handles situations where there are not enough candidates.
         related_clips = []
         for k in range(self.conditioning_candidates):
-            rel_clip = load_audio(random.choice(candidates), self.sample_rate)
+            rel_clip = self.load_wav(random.choice(candidates))
             gap = rel_clip.shape[-1] - self.conditioning_length
             if gap < 0:
                 rel_clip = F.pad(rel_clip, pad=(0, abs(gap)))
@@ -115,11 +364,12 @@ class TextWavLoader(torch.utils.data.Dataset):
         return torch.stack(related_clips, dim=0)
 
     def __getitem__(self, index):
+        item = self.perm[index]
         try:
-            tseq, wav, text, path = self.get_wav_text_pair(self.audiopaths_and_text[index])
-            cond = self.load_conditioning_candidates(self.audiopaths_and_text[index][0]) if self.load_conditioning else None
+            tseq, wav, text, path = self.get_wav_text_pair(item)
+            cond = self.load_conditioning_candidates(self.paths[item]) if self.load_conditioning else None
         except:
-            print(f"error loading {self.audiopaths_and_text[index][0]}")
+            print(f"error loading {self.paths[item]}")
             return self[index+1]
         if wav is None or \
             (self.max_wav_len is not None and wav.shape[-1] > self.max_wav_len) or \
@@ -151,12 +401,85 @@ class TextWavLoader(torch.utils.data.Dataset):
         return tseq, wav, path, text, cond
 
     def __len__(self):
-        return len(self.audiopaths_and_text)
+        return len(self.perm)
+
+
+class AudioCacheFiller(torch.utils.data.Dataset):
+    """
+    Wraps a TextWavLoader so that its audio cache can be pre-populated in parallel, e.g.:
+    for _ in DataLoader(AudioCacheFiller(ds), batch_size=None, num_workers=16): pass
+    """
+    def __init__(self, dataset):
+        assert dataset.audio_cache_dir is not None
+        self.dataset = dataset
+
+    def __getitem__(self, index):
+        path = self.dataset.paths[index]
+        try:
+            self.dataset.load_wav(path, index)
+        except:
+            print(f"error caching {path}")
+        return index
+
+    def __len__(self):
+        return len(self.dataset.paths)
+
+
+class AudioClipDecoder(torch.utils.data.Dataset):
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getitem__(self, index):
+        path = self.dataset.paths[index]
+        try:
+            return path, self.dataset.load_wav(path, index)
+        except:
+            print(f"error loading {path}")
+            return path, None
+
+    def __len__(self):
+        return len(self.dataset.paths)
+
+
+def pack_audio_to_disk(dataset, out_dir, shard_size=4*1024**3, num_workers=8):
+    """
+    Decodes every clip in a TextWavLoader and appends it to contiguous float32 shards (audio_<n>.f32) of at most
+    shard_size bytes, alongside an index.pth holding each clip's shard, offset and length. Point 'packed_audio_dir' at
+    out_dir to train from the shards.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths, shards, offsets, lengths = [], [], [], []
+    shard, offset = 0, 0
+    f = open(os.path.join(out_dir, f'audio_{shard}.f32'), 'wb')
+    dl = torch.utils.data.DataLoader(AudioClipDecoder(dataset), batch_size=None, num_workers=num_workers)
+    for path, wav in tqdm(dl):
+        if wav is None:
+            continue
+        wav = wav.reshape(-1).float().numpy()
+        if offset > 0 and (offset + wav.shape[0]) * 4 > shard_size:
+            f.close()
+            shard += 1
+            offset = 0
+            f = open(os.path.join(out_dir, f'audio_{shard}.f32'), 'wb')
+        f.write(wav.tobytes())
+        paths.append(path)
+        shards.append(shard)
+        offsets.append(offset)
+        lengths.append(wav.shape[0])
+        offset += wav.shape[0]
+    f.close()
+    torch.save({'sample_rate': dataset.sample_rate, 'paths': paths, 'shards': torch.LongTensor(shards),
+                'offsets': torch.LongTensor(offsets), 'lengths': torch.LongTensor(lengths)},
+               os.path.join(out_dir, 'index.pth'))
 
 
 class TextMelCollate():
     """ Zero-pads model inputs and targets based on number of frames per step
     """
+    def __init__(self, pin_memory=False):
+        # Should match the DataLoader's pin_memory setting.
+        self.pin_memory = pin_memory
+
     def __call__(self, batch):
         """Collate's training batch from normalized text and wav
         PARAMS
@@ -167,34 +490,24 @@ class TextMelCollate():
         input_lengths, ids_sorted_decreasing = torch.sort(
             torch.LongTensor([len(x[0]) for x in batch]),
             dim=0, descending=True)
-        max_input_len = input_lengths[0]
-
-        text_padded = torch.LongTensor(len(batch), max_input_len)
-        text_padded.zero_()
-        filenames = []
-        real_text = []
-        conds = []
-        for i in range(len(ids_sorted_decreasing)):
-            text = batch[ids_sorted_decreasing[i]][0]
-            text_padded[i, :text.size(0)] = text
-            filenames.append(batch[ids_sorted_decreasing[i]][2])
-            real_text.append(batch[ids_sorted_decreasing[i]][3])
-            c = batch[ids_sorted_decreasing[i]][4]
-            if c is not None:
-                conds.append(c)
-
-        # Right zero-pad wav
-        num_wavs = batch[0][1].size(0)
-        max_target_len = max([x[1].size(1) for x in batch])
-
-        # include mel padded and gate padded
-        wav_padded = torch.FloatTensor(len(batch), num_wavs, max_target_len)
-        wav_padded.zero_()
-        output_lengths = torch.LongTensor(len(batch))
-        for i in range(len(ids_sorted_decreasing)):
-            wav = batch[ids_sorted_decreasing[i]][1]
-            wav_padded[i, :, :wav.size(1)] = wav
-            output_lengths[i] = wav.size(1)
+        sorted_batch = [batch[i] for i in ids_sorted_decreasing]
+
+        text_padded = pad_sequence([b[0] for b in sorted_batch], batch_first=True).long()
+        filenames = [b[2] for b in sorted_batch]
+        real_text = [b[3] for b in sorted_batch]
+        conds = [b[4] for b in sorted_batch if b[4] is not None]
+
+        # Right zero-pad wav.
+        output_lengths = torch.LongTensor([b[1].size(1) for b in sorted_batch])
+        if self.pin_memory and torch.cuda.is_available() and torch.utils.data.get_worker_info() is None:
+            # When collating in the main process, write the (large) wav batch straight into pinned memory, so the
+            # DataLoader's pin_memory pass has nothing left to copy. Worker processes cannot pin memory themselves.
+            wav_padded = torch.zeros((len(batch), batch[0][1].size(0), output_lengths.max().item()), pin_memory=True)
+            for i, b in enumerate(sorted_batch):
+                wav_padded[i, :, :b[1].size(1)] = b[1]
+        else:
+            # pad_sequence pads the leading dimension, so wavs are padded as (T, C) and then permuted back.
+            wav_padded = pad_sequence([b[1].transpose(0, 1) for b in sorted_batch], batch_first=True).permute(0, 2, 1).contiguous()
 
         res = {
             'padded_text': text_padded,
@@ -29,7 +29,7 @@ class PreprocessedMelDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, index):
         with np.load(self.paths[index]) as npz_file:
-            mel = torch.tensor(npz_file['arr_0'])
+            mel = torch.from_numpy(npz_file['arr_0'])
         assert mel.shape[-1] <= self.pad_to
         if self.squeeze:
             mel = mel.squeeze()
@@ -2,6 +2,8 @@ import os
 import random
 import sys
 
+import numpy as np
+import soundfile
 import torch
 import torch.utils.data
 import torch.nn.functional as F
@@ -10,21 +12,24 @@ from audio2numpy import open_audio
 from tqdm import tqdm
 
 from data.util import find_files_of_type, is_audio_file, load_paths_from_cache
-from models.audio.tts.tacotron2.taco_utils import load_wav_to_torch
-from utils.util import opt_get
+from utils.util import opt_get, resample_audio
 
 
 def load_audio(audiopath, sampling_rate):
-    if audiopath[-4:] == '.wav':
-        audio, lsr = load_wav_to_torch(audiopath)
-    elif audiopath[-4:] == '.mp3':
+    if audiopath[-4:] == '.mp3':
         # https://github.com/neonbjb/pyfastmp3decoder  - Definitely worth it.
         from pyfastmp3decoder.mp3decoder import load_mp3
         audio, lsr = load_mp3(audiopath, sampling_rate)
-        audio = torch.FloatTensor(audio)
+        audio = torch.from_numpy(np.asarray(audio, dtype=np.float32))
     else:
-        audio, lsr = open_audio(audiopath)
-        audio = torch.FloatTensor(audio)
+        try:
+            # Decodes straight to float32 in [-1,1], without the ffmpeg subprocess and float64 copy audio2numpy makes.
+            audio, lsr = soundfile.read(audiopath, dtype='float32', always_2d=True)
+            audio = torch.from_numpy(np.ascontiguousarray(audio.T))
+        except RuntimeError:
+            # Formats libsndfile can't decode.
+            audio, lsr = open_audio(audiopath)
+            audio = torch.from_numpy(np.asarray(audio, dtype=np.float32))
 
     # Remove any channel data.
     if len(audio.shape) > 1:
@@ -35,13 +40,16 @@ def load_audio(audiopath, sampling_rate):
             audio = audio[:, 0]
 
     if lsr != sampling_rate:
-        audio = torchaudio.functional.resample(audio, lsr, sampling_rate)
+        audio = resample_audio(audio, lsr, sampling_rate)
 
-    # Check some assumptions about audio range. This should be automatically fixed in load_wav_to_torch, but might not be in some edge cases, where we should squawk.
+    # Check some assumptions about audio range. This should be automatically fixed by the decoders above, but might not be in some edge cases, where we should squawk.
     # '10' is arbitrarily chosen since it seems like audio will often "overdrive" the [-1,1] bounds.
-    if torch.any(audio > 10) or not torch.any(audio < 0):
-        print(f"Error with {audiopath}. Max={audio.max()} min={audio.min()}")
-    audio.clip_(-1, 1)
+    amin, amax = torch.aminmax(audio)
+    if amax > 10 or amin >= 0:
+        print(f"Error with {audiopath}. Max={amax} min={amin}")
+    # Audio is kept signed in [-1,1]; only pay for the clip when the clip actually overdrives those bounds.
+    if amax > 1 or amin < -1:
+        audio.clip_(-1, 1)
 
     return audio.unsqueeze(0)
 
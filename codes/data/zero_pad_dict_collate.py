@@ -1,5 +1,4 @@
 import torch
-import torch.nn.functional as F
 
 
 class ZeroPadDictCollate():
@@ -8,21 +7,15 @@ class ZeroPadDictCollate():
     tensor, and zero pads all the other tensors together.
     """
     def collate_tensors(self, batch, key):
-        result = []
         largest_dims = [0 for _ in range(len(batch[0][key].shape))]
         for elem in batch:
-            result.append(elem[key])
             largest_dims = [max(current_largest, new_consideration) for current_largest, new_consideration in zip(largest_dims, elem[key].shape)]
-        # Now pad each tensor by the largest dimension.
-        for i in range(len(result)):
-            padding_tuple = ()
-            for d in range(len(largest_dims)):
-                padding_needed = largest_dims[d] - result[i].shape[d]
-                assert padding_needed >= 0
-                padding_tuple = (0, padding_needed) + padding_tuple
-            result[i] = F.pad(result[i], padding_tuple)
-
-        return torch.stack(result, dim=0)
+        # Copy each tensor straight into a single zeroed output rather than padding each one and then stacking them,
+        # which allocated and copied every element twice.
+        result = batch[0][key].new_zeros((len(batch), *largest_dims))
+        for i, elem in enumerate(batch):
+            result[(i,) + tuple(slice(0, d) for d in elem[key].shape)] = elem[key]
+        return result
 
 
     def collate_into_list(self, batch, key):
@@ -33,7 +33,6 @@ def create_hparams(hparams_string=None, verbose=False):
         # Audio Parameters             #
         ################################
         max_wav_value=32768.0,
-        input_sample_rate=22050,  # When different from sampling_rate, dataset automatically interpolates to sampling_rate
         sampling_rate=22050,
         filter_length=1024,
         hop_length=256,  # This means a MEL is 1/256th the equivalent audio.
@@ -65,18 +65,17 @@ class TacotronSTFT(torch.nn.Module):
         """Computes mel-spectrograms from a batch of waves
         PARAMS
         ------
-        y: Variable(torch.FloatTensor) with shape (B, T) in range [-1, 1]
+        y: torch.FloatTensor with shape (B, T) in range [-1, 1]
 
         RETURNS
         -------
         mel_output: torch.FloatTensor of shape (B, n_mel_channels, T)
         """
-        assert(torch.min(y.data) >= -10)
-        assert(torch.max(y.data) <= 10)
+        amin, amax = torch.aminmax(y.data)
+        assert(amin >= -10 and amax <= 10)
         y = torch.clip(y, min=-1, max=1)
 
-        magnitudes, phases = self.stft_fn.transform(y)
-        magnitudes = magnitudes.data
+        magnitudes = self.stft_fn.transform_magnitude(y).data
         mel_output = torch.matmul(self.mel_basis, magnitudes)
         mel_output = self.spectral_normalize(mel_output)
         return mel_output
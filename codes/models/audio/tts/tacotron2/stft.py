@@ -33,7 +33,6 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import torch
 import numpy as np
 import torch.nn.functional as F
-from torch.autograd import Variable
 from scipy.signal import get_window
 from librosa.util import pad_center, tiny
 from models.audio.tts.tacotron2.audio_processing import window_sumsquare
@@ -74,7 +73,7 @@ class STFT(torch.nn.Module):
         self.register_buffer('forward_basis', forward_basis.float())
         self.register_buffer('inverse_basis', inverse_basis.float())
 
-    def transform(self, input_data):
+    def _forward_transform(self, input_data):
         num_batches = input_data.size(0)
         num_samples = input_data.size(1)
 
@@ -90,17 +89,24 @@ class STFT(torch.nn.Module):
 
         forward_transform = F.conv1d(
             input_data,
-            Variable(self.forward_basis, requires_grad=False),
+            self.forward_basis,
             stride=self.hop_length,
             padding=0)
 
         cutoff = int((self.filter_length / 2) + 1)
         real_part = forward_transform[:, :cutoff, :]
         imag_part = forward_transform[:, cutoff:, :]
+        return real_part, imag_part
+
+    def transform_magnitude(self, input_data):
+        """Same as transform() but skips computing the phase, for callers that only need the magnitudes."""
+        real_part, imag_part = self._forward_transform(input_data)
+        return torch.sqrt(real_part**2 + imag_part**2)
 
+    def transform(self, input_data):
+        real_part, imag_part = self._forward_transform(input_data)
         magnitude = torch.sqrt(real_part**2 + imag_part**2)
-        phase = torch.autograd.Variable(
-            torch.atan2(imag_part.data, real_part.data))
+        phase = torch.atan2(imag_part.data, real_part.data)
 
         return magnitude, phase
 
@@ -110,7 +116,7 @@ class STFT(torch.nn.Module):
 
         inverse_transform = F.conv_transpose1d(
             recombine_magnitude_phase,
-            Variable(self.inverse_basis, requires_grad=False),
+            self.inverse_basis,
             stride=self.hop_length,
             padding=0)
 
@@ -122,8 +128,7 @@ class STFT(torch.nn.Module):
             # remove modulation effects
             approx_nonzero_indices = torch.from_numpy(
                 np.where(window_sum > tiny(window_sum))[0])
-            window_sum = torch.autograd.Variable(
-                torch.from_numpy(window_sum), requires_grad=False)
+            window_sum = torch.from_numpy(window_sum)
             window_sum = window_sum.cuda() if magnitude.is_cuda else window_sum
             inverse_transform[:, :, approx_nonzero_indices] /= window_sum[approx_nonzero_indices]
 
@@ -23,7 +23,10 @@ def load_wav_to_torch(full_path):
         norm_fix = 1.
     else:
         raise NotImplemented(f"Provided data dtype not supported: {data.dtype}")
-    return (torch.FloatTensor(data.astype(np.float32)) / norm_fix, sampling_rate)
+    audio = torch.from_numpy(data.astype(np.float32, copy=not data.flags.writeable))
+    if norm_fix != 1.:
+        audio.div_(norm_fix)
+    return (audio, sampling_rate)
 
 
 def load_filepaths_and_text_type(filename, type, split="|"):
@@ -48,4 +51,4 @@ def to_gpu(x):
 
     if torch.cuda.is_available():
         x = x.cuda(non_blocking=True)
-    return torch.autograd.Variable(x)
\ No newline at end of file
+    return x
\ No newline at end of file
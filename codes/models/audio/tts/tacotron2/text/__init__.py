@@ -10,6 +10,8 @@ from models.audio.tts.tacotron2.text.symbols import symbols
 # Mappings from symbol to numeric ID and vice versa:
 _symbol_to_id = {s: i for i, s in enumerate(symbols)}
 _id_to_symbol = {i: s for i, s in enumerate(symbols)}
+# Subset of _symbol_to_id that _symbols_to_sequence emits, so each symbol costs a single dict lookup.
+_kept_symbol_to_id = {s: i for s, i in _symbol_to_id.items() if s != '_' and s != '~'}
 
 # Regular expression matching text enclosed in curly braces:
 _curly_re = re.compile(r'(.*?)\{(.+?)\}(.*)')
@@ -76,12 +78,8 @@ def _clean_text(text, cleaner_names):
 
 
 def _symbols_to_sequence(symbols):
-  return [_symbol_to_id[s] for s in symbols if _should_keep_symbol(s)]
+  return [_kept_symbol_to_id[s] for s in symbols if s in _kept_symbol_to_id]
 
 
 def _arpabet_to_sequence(text):
   return _symbols_to_sequence(['@' + s for s in text.split()])
-
-
-def _should_keep_symbol(s):
-  return s in _symbol_to_id and s != '_' and s != '~'
@@ -45,8 +45,10 @@ _abbreviations = [(re.compile('\\b%s\\.' % x[0], re.IGNORECASE), x[1]) for x in
 
 
 def expand_abbreviations(text):
+  # Applied one after another: each expansion can change the word boundaries that later patterns see, so folding these
+  # into a single alternation would change the output (e.g. for "mrs.mr.dr.").
   for regex, replacement in _abbreviations:
-    text = re.sub(regex, replacement, text)
+    text = regex.sub(replacement, text)
   return text
 
 
@@ -59,7 +61,7 @@ def lowercase(text):
 
 
 def collapse_whitespace(text):
-  return re.sub(_whitespace_re, ' ', text)
+  return _whitespace_re.sub(' ', text)
 
 
 def convert_to_ascii(text):
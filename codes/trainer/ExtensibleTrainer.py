@@ -231,7 +231,8 @@ class ExtensibleTrainer(BaseModel):
                 else:
                     v = v[sort_indices]
             if isinstance(v, torch.Tensor):
-                self.dstate[k] = [t.to(self.device) for t in torch.chunk(v, chunks=batch_factor, dim=0)]
+                # Batches come from pinned memory (see create_dataloader), so these copies can overlap with compute.
+                self.dstate[k] = [t.to(self.device, non_blocking=True) for t in torch.chunk(v, chunks=batch_factor, dim=0)]
 
         if opt_get(self.opt, ['train', 'auto_collate'], False):
             for k, v in self.dstate.items():
@@ -25,6 +25,27 @@ def normalize_mel(mel):
 def denormalize_mel(norm_mel):
     return ((norm_mel+1)/2) * (TACOTRON_MEL_MAX - MEL_MIN) + MEL_MIN
 
+def compile_mel_transform(transform, example_input):
+    """
+    Fuses a mel transform's ops with torch.compile where available, falling back to TorchScript and then to the eager
+    transform. Both compilers can fail lazily, so each candidate is exercised on example_input before being returned.
+    """
+    if hasattr(torch, 'compile'):
+        try:
+            compiled = torch.compile(transform, dynamic=True)
+            compiled(example_input)
+            return compiled
+        except Exception as e:
+            print(f"torch.compile failed for mel transform, falling back to TorchScript: {e}")
+    try:
+        scripted = torch.jit.script(transform)
+        scripted(example_input)
+        return scripted
+    except Exception as e:
+        print(f"TorchScript failed for mel transform, using it uncompiled: {e}")
+    return transform
+
+
 class MelSpectrogramInjector(Injector):
     def __init__(self, opt, env):
         super().__init__(opt, env)
@@ -41,15 +62,16 @@ class MelSpectrogramInjector(Injector):
         self.do_normalization = opt_get(opt, ['do_normalization'], None)  # This is different from the TorchMelSpectrogramInjector. This just normalizes to the range [-1,1]
 
     def forward(self, state):
-        inp = state[self.input]
-        if len(inp.shape) == 3:  # Automatically squeeze out the channels dimension if it is present (assuming mono-audio)
-            inp = inp.squeeze(1)
-        assert len(inp.shape) == 2
-        self.stft = self.stft.to(inp.device)
-        mel = self.stft.mel_spectrogram(inp)
-        if self.do_normalization:
-            mel = normalize_mel(mel)
-        return {self.output: mel}
+        with torch.no_grad():
+            inp = state[self.input]
+            if len(inp.shape) == 3:  # Automatically squeeze out the channels dimension if it is present (assuming mono-audio)
+                inp = inp.squeeze(1)
+            assert len(inp.shape) == 2
+            self.stft = self.stft.to(inp.device)
+            mel = self.stft.mel_spectrogram(inp)
+            if self.do_normalization:
+                mel = normalize_mel(mel)
+            return {self.output: mel}
 
 
 class TorchMelSpectrogramInjector(Injector):
@@ -66,7 +88,7 @@ class TorchMelSpectrogramInjector(Injector):
         norm = opt_get(opt, ['normalize'], False)
         self.true_norm = opt_get(opt, ['true_normalization'], False)
         self.mel_stft = torchaudio.transforms.MelSpectrogram(n_fft=self.filter_length, hop_length=self.hop_length,
-                                                             win_length=self.win_length, power=2, normalized=norm,
+                                                             win_length=self.win_length, power=2.0, normalized=norm,
                                                              sample_rate=self.sampling_rate, f_min=self.mel_fmin,
                                                              f_max=self.mel_fmax, n_mels=self.n_mel_channels,
                                                              norm="slaney")
@@ -75,6 +97,8 @@ class TorchMelSpectrogramInjector(Injector):
             self.mel_norms = torch.load(self.mel_norm_file)
         else:
             self.mel_norms = None
+        self.compile = opt_get(opt, ['compile'], False)
+        self.compiled_mel_stft = None  # Built on first forward(), once the transform is on its final device.
 
     def forward(self, state):
         with torch.no_grad():
@@ -83,7 +107,12 @@ class TorchMelSpectrogramInjector(Injector):
                 inp = inp.squeeze(1)
             assert len(inp.shape) == 2
             self.mel_stft = self.mel_stft.to(inp.device)
-            mel = self.mel_stft(inp)
+            if self.compile:
+                if self.compiled_mel_stft is None:
+                    self.compiled_mel_stft = compile_mel_transform(self.mel_stft, inp)
+                mel = self.compiled_mel_stft(inp)
+            else:
+                mel = self.mel_stft(inp)
             # Perform dynamic range compression
             mel = torch.log(torch.clamp(mel, min=1e-5))
             if self.mel_norms is not None:
@@ -164,10 +193,13 @@ class AudioResampleInjector(Injector):
         super().__init__(opt, env)
         self.input_sr = opt['input_sample_rate']
         self.output_sr = opt['output_sample_rate']
+        # Build the resampling kernel once rather than on every forward().
+        self.resampler = torchaudio.transforms.Resample(self.input_sr, self.output_sr)
 
     def forward(self, state):
         inp = state[self.input]
-        return {self.output: torchaudio.functional.resample(inp, self.input_sr, self.output_sr)}
+        self.resampler = self.resampler.to(inp.device)
+        return {self.output: self.resampler(inp)}
 
 
 class DiscreteTokenInjector(Injector):
@@ -255,6 +287,15 @@ class ReverseUnivnetInjector(Injector):
         self.mel_input_key = opt['mel']
         self.label_output_key = opt['labels']
         self.do_augmentations = opt_get(opt, ['do_aug'], True)
+        # Band-limits audio by round-tripping it through a 10kHz sample rate. The kernels are built once here rather
+        # than on every call.
+        self.downsampler = torchaudio.transforms.Resample(24000, 10000)
+        self.upsampler = torchaudio.transforms.Resample(10000, 24000)
+
+    def band_limit(self, audio):
+        self.downsampler = self.downsampler.to(audio.device)
+        self.upsampler = self.upsampler.to(audio.device)
+        return self.upsampler(self.downsampler(audio))
 
     def forward(self, state):
         with torch.no_grad():
@@ -266,9 +307,9 @@ class ReverseUnivnetInjector(Injector):
                 original_audio = original_audio + torch.rand_like(original_audio) * random.random() * .005
                 decoded_mel = decoded_mel + torch.rand_like(decoded_mel) * random.random() * .005
                 if(random.random() < .5):
-                    original_audio = torchaudio.functional.resample(torchaudio.functional.resample(original_audio, 24000, 10000), 10000, 24000)
+                    original_audio = self.band_limit(original_audio)
                 if(random.random() < .5):
-                    decoded_mel = torchaudio.functional.resample(torchaudio.functional.resample(decoded_mel, 24000, 10000), 10000, 24000)
+                    decoded_mel = self.band_limit(decoded_mel)
                 if(random.random() < .5):
                     original_audio = torchaudio.functional.resample(original_audio, 24000, 22000 + random.randint(0,2000))
                 if(random.random() < .5):
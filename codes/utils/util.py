@@ -562,6 +562,18 @@ def find_audio_files(base_path, globs=['*.wav', '*.mp3', '*.ogg', '*.flac']):
     return paths
 
 
+# Building a resampling kernel costs more than applying it, so kernels are cached per (source, target) rate pair. The
+# cache is only filled on use, so each dataloader worker builds its own after forking.
+_resamplers = {}
+
+
+def resample_audio(audio, orig_sr, target_sr):
+    key = (int(orig_sr), int(target_sr))
+    if key not in _resamplers:
+        _resamplers[key] = torchaudio.transforms.Resample(key[0], key[1])
+    return _resamplers[key](audio)
+
+
 def load_audio(audiopath, sampling_rate, raw_data=None):
     audiopath = str(audiopath)
     if raw_data is not None:
@@ -572,17 +584,16 @@ def load_audio(audiopath, sampling_rate, raw_data=None):
             audio, lsr = load_wav_to_torch(audiopath)
         elif audiopath[-5:] == '.flac':
             import soundfile as sf
-            audio, lsr = sf.read(audiopath)
-            audio = torch.FloatTensor(audio)
+            audio, lsr = sf.read(audiopath, dtype='float32')
+            audio = torch.from_numpy(audio)
         elif audiopath[-4:] == '.aac':
             # Process AAC files using pydub. I'd use this for everything except I'm cornered into backwards compatibility.
             from pydub import AudioSegment
             asg = AudioSegment.from_file(audiopath)
             dtype = getattr(np, "int{:d}".format(asg.sample_width * 8))
             arr = np.ndarray((int(asg.frame_count()), asg.channels), buffer=asg.raw_data, dtype=dtype)
-            arr = arr.astype('float') / (2 ** (asg.sample_width * 8 - 1))
-            arr = arr[:,0]
-            audio = torch.FloatTensor(arr)
+            arr = arr[:,0].astype(np.float32) / (2 ** (asg.sample_width * 8 - 1))
+            audio = torch.from_numpy(arr)
             lsr = asg.frame_rate
         else:
             audio, lsr = open_audio(audiopath)
@@ -597,7 +608,7 @@ def load_audio(audiopath, sampling_rate, raw_data=None):
             audio = audio[:, 0]
 
     if lsr != sampling_rate:
-        audio = torchaudio.functional.resample(audio, lsr, sampling_rate)
+        audio = resample_audio(audio, lsr, sampling_rate)
 
     # Check some assumptions about audio range. This should be automatically fixed in load_wav_to_torch, but might not be in some edge cases, where we should squawk.
     # '2' is arbitrarily chosen since it seems like audio will often "overdrive" the [-1,1] bounds.
@@ -628,7 +639,12 @@ def load_wav_to_torch(full_path):
         norm_fix = 1.
     else:
         raise NotImplemented(f"Provided data dtype not supported: {data.dtype}")
-    return (torch.FloatTensor(data.astype(np.float32)) / norm_fix, sampling_rate)
+    # astype() is a no-op for writable float32 data, and the rescale happens in-place, so at most one copy of the clip
+    # is made. Read-only buffers (e.g. scipy reading from a BytesIO) are copied, since callers modify the clip in-place.
+    audio = torch.from_numpy(data.astype(np.float32, copy=not data.flags.writeable))
+    if norm_fix != 1.:
+        audio.div_(norm_fix)
+    return (audio, sampling_rate)
 
 
 def get_network_description(network):